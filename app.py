@@ -1,91 +1,450 @@
 import os
-import tempfile
-import streamlit as st
+import re
 import time
-import arxiv
-from langchain_community.document_loaders import PyPDFLoader
+import asyncio
+import contextvars
+import hashlib
+import threading
+from collections import deque
+import diskcache
+import numpy as np
+import tiktoken
+import streamlit as st
 from langchain_text_splitters import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_community.chat_models import ChatOpenAI
-from langchain_core.output_parsers import StrOutputParser
+from langchain_core.output_parsers import StrOutputParser, JsonOutputParser
+from langchain_core.pydantic_v1 import BaseModel, Field
 
 DEEPSEEK_API_KEY = st.secrets["my_api_key"]
 DEEPSEEK_API_BASE = "https://openrouter.ai/api/v1"
+MAX_RETRIES = 5
+REQUESTS_PER_MINUTE = 20
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "rangkumin")
+CACHE_VERSION = 7
+MAX_CACHED_DOCUMENTS = 16
+DOCUMENT_CACHE_TTL_SECONDS = 3600
+CACHED_FIELDS = ["splits", "summary", "citations", "related_papers"]
+EMBEDDING_MODEL = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+SEMANTIC_CACHE_THRESHOLD = 0.92
+RETRIEVAL_K = 4
+TOKEN_ENCODING = "cl100k_base"
+CHUNK_TOKENS = 400
+CHUNK_OVERLAP_TOKENS = 20
+MIN_CHUNK_TOKENS = 100
+MAX_CHUNK_TOKENS = 450
+MIN_OVERLAP_CHARS = 20
+MAX_OVERLAP_CHARS = CHUNK_OVERLAP_TOKENS * 10
+CONTEXT_WINDOW_TOKENS = 64000
+MAX_OUTPUT_TOKENS = 4000
+PROMPT_OVERHEAD_TOKENS = 1500
+DOCUMENT_TOKEN_BUDGET = CONTEXT_WINDOW_TOKENS - MAX_OUTPUT_TOKENS - PROMPT_OVERHEAD_TOKENS
+HEAD_TOKEN_SHARE = 0.4 / (0.4 + 0.3)
+SECTION_TOKENS = 16000
+MAX_CONCURRENT_SECTIONS = 8
+TITLE_ABSTRACT_CHARS = 2000
+ARXIV_API_URL = "https://export.arxiv.org/api/query"
+ARXIV_TIMEOUT_SECONDS = 10
+ARXIV_MIN_INTERVAL_SECONDS = 3
+RELATED_PAPER_COUNT = 5
+REFERENCES_PATTERN = re.compile(
+    r"^[ \t]*(?:[\dIVX]+\.?[ \t]*)?(?:references|bibliography|daftar pustaka|daftar referensi|referensi)[ \t]*:?[ \t]*$",
+    re.IGNORECASE | re.MULTILINE
+)
 
-def initialize_llm():
-    """Initialize the DeepSeek v3 LLM through OpenRouter"""
+def initialize_llm(async_client):
+    """Initialize the DeepSeek v3 LLM through OpenRouter on the given async client"""
+    from langchain_community.chat_models import ChatOpenAI
     return ChatOpenAI(
         model_name="deepseek/deepseek-chat:free",
         openai_api_key=DEEPSEEK_API_KEY,
         openai_api_base=DEEPSEEK_API_BASE,
         temperature=0.3,
-        max_tokens=4000
+        max_tokens=MAX_OUTPUT_TOKENS,
+        max_retries=MAX_RETRIES,
+        async_client=async_client.chat.completions
     )
 
-def load_and_split_pdf(pdf_file):
-    """Load and split the PDF into chunks"""
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
-        tmp_file.write(pdf_file.read())
-        tmp_file_path = tmp_file.name
+current_llm = contextvars.ContextVar("current_llm")
+
+def run_async(coroutine):
+    """Run a coroutine on a fresh event loop with an LLM client that belongs to that loop.
     
-    try:
-        loader = PyPDFLoader(tmp_file_path)
-        pages = loader.load()
-        
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=4000,
-            chunk_overlap=200,
-            length_function=len
+    httpx connection pools are tied to the loop that opened them, so the client
+    is created and closed around every asyncio.run instead of being cached.
+    """
+    from openai import AsyncOpenAI
+    
+    async def run_with_llm():
+        async_client = AsyncOpenAI(api_key=DEEPSEEK_API_KEY, base_url=DEEPSEEK_API_BASE, max_retries=MAX_RETRIES)
+        current_llm.set(initialize_llm(async_client))
+        try:
+            return await coroutine
+        finally:
+            await async_client.close()
+    
+    return asyncio.run(run_with_llm())
+
+@st.cache_resource(show_spinner=False)
+def get_request_window():
+    """Track the start times of recent LLM requests across all sessions"""
+    return deque(), threading.Lock()
+
+async def throttle_request():
+    """Wait until the requests-per-minute budget allows another LLM call"""
+    request_times, lock = get_request_window()
+    while True:
+        with lock:
+            now = time.monotonic()
+            while request_times and now - request_times[0] >= 60:
+                request_times.popleft()
+            if len(request_times) < REQUESTS_PER_MINUTE:
+                request_times.append(now)
+                return
+            wait_seconds = 60 - (now - request_times[0])
+        await asyncio.sleep(wait_seconds)
+
+@st.cache_resource(show_spinner=False)
+def load_embeddings():
+    """Load the local sentence embedding model"""
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(
+        model_name=EMBEDDING_MODEL,
+        encode_kwargs={"normalize_embeddings": True}
+    )
+
+@st.cache_resource(show_spinner=False, max_entries=MAX_CACHED_DOCUMENTS, ttl=DOCUMENT_CACHE_TTL_SECONDS)
+def build_vectorstore(document_hash, _splits):
+    """Build the FAISS index over the PDF chunks, once per document"""
+    from langchain_community.vectorstores import FAISS
+    return FAISS.from_documents(_splits, load_embeddings())
+
+@st.cache_resource(show_spinner=False)
+def get_disk_cache():
+    """Open the persistent cache of per-PDF results"""
+    return diskcache.Cache(CACHE_DIR)
+
+def load_cached_results(document_hash):
+    """Return the cached results for a PDF hash, or None on a cache miss"""
+    return get_disk_cache().get((document_hash, CACHE_VERSION))
+
+def save_cached_results(document_hash):
+    """Persist the current session results for a PDF hash"""
+    results = {field: st.session_state[field] for field in CACHED_FIELDS}
+    results["related_papers"] = results["related_papers"] or None
+    get_disk_cache().set((document_hash, CACHE_VERSION), results)
+
+async def stream_to_placeholder(chain, inputs, placeholder=None):
+    """Stream the chain output into a Streamlit placeholder and return the full text"""
+    await throttle_request()
+    response = ""
+    async for chunk in chain.astream(inputs):
+        response += chunk
+        if placeholder is not None:
+            placeholder.markdown(response + "▌")
+    if placeholder is not None:
+        placeholder.markdown(response)
+    return response
+
+def count_tokens(text):
+    """Count the tokens in a text"""
+    return len(tiktoken.get_encoding(TOKEN_ENCODING).encode(text))
+
+def normalize_chunks(splits, text_splitter):
+    """Merge chunks that are too small and re-split chunks that are too large"""
+    merged = []
+    for doc in splits:
+        if merged:
+            previous_tokens = count_tokens(merged[-1].page_content)
+            current_tokens = count_tokens(doc.page_content)
+            if min(previous_tokens, current_tokens) < MIN_CHUNK_TOKENS and previous_tokens + current_tokens <= MAX_CHUNK_TOKENS:
+                merged[-1] = Document(
+                    page_content=merged[-1].page_content + "\n" + doc.page_content,
+                    metadata=merged[-1].metadata
+                )
+                continue
+        merged.append(doc)
+    
+    normalized = []
+    for doc in merged:
+        if count_tokens(doc.page_content) > MAX_CHUNK_TOKENS:
+            normalized.extend(text_splitter.split_documents([doc]))
+        else:
+            normalized.append(doc)
+    return normalized
+
+def strip_references(texts):
+    """Drop the reference list at the end of the paper"""
+    for index in range(len(texts) - 1, len(texts) // 2 - 1, -1):
+        headings = list(REFERENCES_PATTERN.finditer(texts[index]))
+        if headings:
+            return texts[:index] + [texts[index][:headings[-1].start()]]
+    return texts
+
+def trim_overlaps(texts):
+    """Drop the text each chunk repeats from the end of the previous one"""
+    trimmed = texts[:1]
+    for previous, text in zip(texts, texts[1:]):
+        longest = min(len(previous), len(text), MAX_OVERLAP_CHARS)
+        overlap = next(
+            (size for size in range(longest, MIN_OVERLAP_CHARS - 1, -1) if previous.endswith(text[:size])),
+            0
         )
-        splits = text_splitter.split_documents(pages)
-        return splits
-    finally:
-        os.unlink(tmp_file_path)
-
-def generate_summary(document_text):
-    """Generate a structured summary of the journal paper"""
-    llm = initialize_llm()
+        trimmed.append(text[overlap:].lstrip())
+    return trimmed
+
+def build_document_text(splits, max_tokens=DOCUMENT_TOKEN_BUDGET):
+    """Join the PDF chunks into one prompt input that fits the token budget.
+    
+    References are dropped first. A document still over budget keeps its
+    opening (abstract, introduction) and closing (results, conclusion) parts.
+    """
+    encoding = tiktoken.get_encoding(TOKEN_ENCODING)
+    texts = trim_overlaps(strip_references([doc.page_content for doc in splits]))
+    encoded = [encoding.encode(text) for text in texts]
+    if sum(len(tokens) for tokens in encoded) <= max_tokens:
+        return "\n\n".join(texts)
+    
+    head_budget = int(max_tokens * HEAD_TOKEN_SHARE)
+    head = []
+    remaining_tokens = head_budget
+    for text, tokens in zip(texts, encoded):
+        if len(tokens) > remaining_tokens:
+            head.append(encoding.decode(tokens[:remaining_tokens]))
+            break
+        head.append(text)
+        remaining_tokens -= len(tokens)
     
-    prompt_template = ChatPromptTemplate.from_messages([
-    ("system", """Anda adalah asisten penelitian akademik. Ekstrak informasi berikut dari jurnal dalam format poin-poin tanpa kalimat pengantar atau penjelasan tambahan:
-
-- **Judul**: [Judul jurnal]
-(beri jarak)
-- **Author(s)**: [Daftar penulis]
-(beri jarak)
-- **Abstract**: [Ringkasan konten jurnal]
-(beri jarak)
-- **Keywords**: [Kata kunci penting]
-(beri jarak)
-- **Metode Penelitian**: [Metodologi yang digunakan]
-(beri jarak)
-- **Publisher**: [Penerbit atau nama jurnal] atau 'Tidak Diketahui'
-(beri jarak)
-- **Tanggal Publish**: [Tanggal publikasi] atau 'Tidak Diketahui'
-(beri jarak)
-- **Kesimpulan**: [Kesimpulan utama penelitian]
-(beri jarak)
-- **DOI**: [Link atau nomor DOI] atau 'Tidak Diketahui'
-
-Aturan ketat:
-1. Hanya output informasi dalam format poin di atas
-2. Tidak ada kalimat pengantar
-3. Tidak ada catatan atau penjelasan tambahan
-4. Jika informasi tidak ada, cukup tulis 'Tidak Diketahui'
-5. Gunakan bahasa Indonesia secara konsisten
-6. Berikan jarak setidaknya 1 baris disetiap poinnya, misal judul lalu beri baris, author lalu beri baris, abstrak lalu beri baris"""),
-    ("user", "{document_text}")
-])
+    tail = []
+    remaining_tokens = max_tokens - head_budget
+    for text, tokens in zip(reversed(texts), reversed(encoded)):
+        if len(tokens) > remaining_tokens:
+            if remaining_tokens > 0:
+                tail.append(encoding.decode(tokens[-remaining_tokens:]))
+            break
+        tail.append(text)
+        remaining_tokens -= len(tokens)
     
-    chain = prompt_template | llm | StrOutputParser()
-    return chain.invoke({"document_text": document_text})
+    return "\n\n".join(head) + "\n\n[...]\n\n" + "\n\n".join(reversed(tail))
 
-def chat_with_pdf(question, document_text):
-    """Generate answer based on the PDF content"""
-    llm = initialize_llm()
+def extract_page_texts(pdf_bytes):
+    """Extract the text of every page"""
+    import fitz
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as pdf:
+        return [page.get_text("text") for page in pdf]
+
+def get_title_and_abstract(splits):
+    """Return the opening text of the paper, where the title and abstract live"""
+    opening = []
+    length = 0
+    for doc in splits:
+        if length >= TITLE_ABSTRACT_CHARS:
+            break
+        opening.append(doc.page_content)
+        length += len(doc.page_content)
+    return "\n\n".join(opening)[:TITLE_ABSTRACT_CHARS]
+
+@st.cache_data(show_spinner=False, max_entries=MAX_CACHED_DOCUMENTS, ttl=DOCUMENT_CACHE_TTL_SECONDS)
+def load_and_split_pdf(document_hash, _pdf_file):
+    """Load and split the PDF into chunks, once per document hash"""
+    pages = [
+        Document(page_content=text, metadata={"source": _pdf_file.name, "page": number})
+        for number, text in enumerate(extract_page_texts(_pdf_file.getvalue()))
+    ]
     
-    prompt_template = ChatPromptTemplate.from_messages([
-        ("system", """Kamu adalah personifikasi dari jurnal akademik ini. 
+    text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+        encoding_name=TOKEN_ENCODING,
+        chunk_size=CHUNK_TOKENS,
+        chunk_overlap=CHUNK_OVERLAP_TOKENS,
+        separators=["\n\n", "\n", ". ", " ", ""]
+    )
+    splits = text_splitter.split_documents(pages)
+    return normalize_chunks(splits, text_splitter)
+
+class JournalSummary(BaseModel):
+    judul: str = Field(description="Judul jurnal")
+    authors: list[str] = Field(description="Daftar penulis")
+    abstract: str = Field(description="Ringkasan konten jurnal")
+    keywords: list[str] = Field(description="Kata kunci penting")
+    metode_penelitian: str = Field(description="Metodologi yang digunakan")
+    publisher: str = Field(description="Penerbit atau nama jurnal")
+    tanggal_publish: str = Field(description="Tanggal publikasi")
+    kesimpulan: str = Field(description="Kesimpulan utama penelitian")
+    doi: str = Field(description="Link atau nomor DOI")
+
+class Citations(BaseModel):
+    apa: str = Field(description="APA citation")
+    mla: str = Field(description="MLA citation")
+    harvard: str = Field(description="Harvard citation")
+    ieee: str = Field(description="IEEE citation")
+    chicago: str = Field(description="Chicago citation")
+    vancouver: str = Field(description="Vancouver citation")
+    ama: str = Field(description="AMA citation")
+
+class Report(BaseModel):
+    summary: JournalSummary = Field(description="Ringkasan terstruktur jurnal")
+    citations: Citations = Field(description="Sitasi jurnal dalam berbagai gaya")
+
+SUMMARY_LABELS = [
+    ("judul", "Judul"),
+    ("authors", "Author(s)"),
+    ("abstract", "Abstract"),
+    ("keywords", "Keywords"),
+    ("metode_penelitian", "Metode Penelitian"),
+    ("publisher", "Publisher"),
+    ("tanggal_publish", "Tanggal Publish"),
+    ("kesimpulan", "Kesimpulan"),
+    ("doi", "DOI")
+]
+
+CITATION_STYLES = [
+    ("apa", "APA"),
+    ("mla", "MLA"),
+    ("harvard", "Harvard"),
+    ("ieee", "IEEE"),
+    ("chicago", "Chicago"),
+    ("vancouver", "Vancouver"),
+    ("ama", "AMA")
+]
+
+def render_summary(summary):
+    """Render the (possibly partial) structured summary as markdown points"""
+    points = []
+    for key, label in SUMMARY_LABELS:
+        value = summary.get(key)
+        if isinstance(value, list):
+            value = ", ".join(value)
+        if value:
+            points.append(f"- **{label}**: {value}")
+    return "\n\n".join(points)
+
+def render_citations(citations):
+    """Render the (possibly partial) structured citations as markdown"""
+    return "\n\n".join(
+        f"**{label} Style**\n<br>\n{citations[key]}"
+        for key, label in CITATION_STYLES if citations.get(key)
+    )
+
+CITATION_RULES = """Rules for "citations":
+1. Each field contains only the citation text in that style, without the style name
+2. Include all available elements: authors, title, journal, year, volume, issue, pages, DOI
+3. For missing information, use [assumed information] and keep it minimal"""
+
+REPORT_SYSTEM_PROMPT = """Anda adalah asisten penelitian akademik. Dari jurnal yang diberikan, buat dua keluaran sekaligus dalam satu objek JSON: ringkasan terstruktur ("summary") dan sitasi dalam berbagai gaya ("citations").
+
+Aturan ketat ringkasan ("summary"):
+1. Isi setiap field hanya dengan informasi dari jurnal, tanpa kalimat pengantar atau penjelasan tambahan
+2. Jika informasi tidak ada, cukup tulis 'Tidak Diketahui'
+3. Gunakan bahasa Indonesia secara konsisten, kecuali judul, nama penulis, dan DOI yang ditulis persis seperti di jurnal
+
+""" + CITATION_RULES + """
+
+{format_instructions}"""
+
+CITATIONS_SYSTEM_PROMPT = """Anda adalah asisten penelitian akademik. Dari jurnal yang diberikan, buat sitasi dalam berbagai gaya ("citations") dalam satu objek JSON.
+
+""" + CITATION_RULES + """
+
+{format_instructions}"""
+
+@st.cache_resource(show_spinner=False)
+def get_report_prompt():
+    """Build the summary and citations prompt once per process"""
+    return ChatPromptTemplate.from_messages([
+        ("system", REPORT_SYSTEM_PROMPT),
+        ("user", "{document_text}")
+    ]).partial(format_instructions=JsonOutputParser(pydantic_object=Report).get_format_instructions())
+
+def get_report_chain():
+    """Compose the summary and citations chain on the LLM of the running event loop"""
+    return get_report_prompt() | current_llm.get().bind(response_format={"type": "json_object"}) | JsonOutputParser(pydantic_object=Report)
+
+@st.cache_resource(show_spinner=False)
+def get_citations_prompt():
+    """Build the citations-only prompt once per process"""
+    return ChatPromptTemplate.from_messages([
+        ("system", CITATIONS_SYSTEM_PROMPT),
+        ("user", "{document_text}")
+    ]).partial(format_instructions=JsonOutputParser(pydantic_object=Citations).get_format_instructions())
+
+def get_citations_chain():
+    """Compose the citations-only chain on the LLM of the running event loop"""
+    return get_citations_prompt() | current_llm.get().bind(response_format={"type": "json_object"}) | JsonOutputParser(pydantic_object=Citations)
+
+async def stream_structured(chain, document_text, render, placeholder=None):
+    """Stream a JSON chain, rendering the partial object into a placeholder, and return the final object"""
+    await throttle_request()
+    result = {}
+    async for result in chain.astream({"document_text": document_text}):
+        if placeholder is not None and result:
+            placeholder.markdown(render(result) + "▌")
+    if placeholder is not None:
+        placeholder.markdown(render(result))
+    return result
+
+async def generate_report(document_text, placeholder=None):
+    """Generate the summary and citations in one call, streaming the summary into a placeholder"""
+    return await stream_structured(
+        get_report_chain(), document_text, lambda report: render_summary(report.get("summary") or {}), placeholder
+    )
+
+async def generate_citations(document_text, placeholder=None):
+    """Generate only the citations, streaming them into a placeholder"""
+    return await stream_structured(get_citations_chain(), document_text, render_citations, placeholder)
+
+NOTES_SYSTEM_PROMPT = """Anda adalah asisten penelitian akademik. Teks berikut adalah satu bagian dari jurnal yang panjang. Catat secara ringkas semua informasi dari bagian ini yang berguna untuk ringkasan dan sitasi jurnal: judul, penulis, abstrak, kata kunci, metode penelitian, penerbit, tanggal publikasi, volume, nomor, halaman, DOI, hasil, dan kesimpulan.
+
+Aturan:
+1. Hanya catat informasi yang benar-benar ada di bagian ini
+2. Tidak ada kalimat pengantar atau penjelasan tambahan
+3. Tulis judul, nama penulis, dan DOI persis seperti di teks"""
+
+@st.cache_resource(show_spinner=False)
+def get_notes_prompt():
+    """Build the section notes prompt once per process"""
+    return ChatPromptTemplate.from_messages([
+        ("system", NOTES_SYSTEM_PROMPT),
+        ("user", "{document_text}")
+    ])
+
+def get_notes_chain():
+    """Compose the section notes chain on the LLM of the running event loop"""
+    return get_notes_prompt() | current_llm.get() | StrOutputParser()
+
+async def condense_section(section_text, semaphore):
+    """Condense one section of a long paper into notes"""
+    async with semaphore:
+        await throttle_request()
+        return await get_notes_chain().ainvoke({"document_text": section_text})
+
+async def prepare_report_input(splits):
+    """Build the report input, condensing papers over the token budget section by section"""
+    document_text = "\n\n".join(trim_overlaps(strip_references([doc.page_content for doc in splits])))
+    if count_tokens(document_text) <= DOCUMENT_TOKEN_BUDGET:
+        return document_text
+    
+    section_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+        encoding_name=TOKEN_ENCODING,
+        chunk_size=SECTION_TOKENS,
+        chunk_overlap=0
+    )
+    sections = section_splitter.split_text(document_text)
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_SECTIONS)
+    notes = await asyncio.gather(*(condense_section(section, semaphore) for section in sections))
+    return build_document_text([Document(page_content=note) for note in notes])
+
+async def summarize_document(splits, placeholder=None):
+    """Generate the report for the whole paper, condensing it first when it is too long"""
+    return await generate_report(await prepare_report_input(splits), placeholder)
+
+async def cite_document(splits, placeholder=None):
+    """Generate the citations for the whole paper from the same input as the report"""
+    return await generate_citations(await prepare_report_input(splits), placeholder)
+
+CHAT_DOCUMENT_PROMPT = """Potongan isi jurnal yang relevan:
+{document_text}"""
+
+CHAT_PERSONA_PROMPT = """Kamu adalah personifikasi dari jurnal akademik di atas. 
         Jawablah pertanyaan seolah-olah kamu adalah jurnal yang sedang berbicara (gunakan sudut pandang pertama/persona pertama).
         Gunakan kata ganti "aku" untuk merujuk pada jurnal ini.
         Berikan jawaban hanya berdasarkan informasi yang ada dalam konten jurnal.
@@ -96,118 +455,146 @@ def chat_with_pdf(question, document_text):
         Jawab: Aku dipublikasikan pada tanggal 20 Desember 2023
         
         User: Siapa penulismu?
-        Jawab: Penulisku adalah [nama penulis] dan tim penelitian dari [institusi]
-        
-        Isi jurnal:
-        {document_text}"""),
+        Jawab: Penulisku adalah [nama penulis] dan tim penelitian dari [institusi]"""
+
+@st.cache_resource(show_spinner=False)
+def get_chat_prompt():
+    """Build the chat prompt once per process"""
+    return ChatPromptTemplate.from_messages([
+        ("system", CHAT_DOCUMENT_PROMPT),
+        ("system", CHAT_PERSONA_PROMPT),
         ("user", "{question}")
     ])
+
+def get_chat_chain():
+    """Compose the chat chain on the LLM of the running event loop"""
+    return get_chat_prompt() | current_llm.get() | StrOutputParser()
+
+async def chat_with_pdf(question, vectorstore, document_hash, placeholder=None):
+    """Generate answer from the most relevant PDF chunks, reusing answers to similar questions"""
+    question_embedding = np.array(load_embeddings().embed_query(question))
+    cached_answers = st.session_state.semantic_cache.setdefault(document_hash, [])
+    if cached_answers:
+        similarities = np.stack([embedding for embedding, _, _ in cached_answers]) @ question_embedding
+        best_match = int(np.argmax(similarities))
+        if similarities[best_match] >= SEMANTIC_CACHE_THRESHOLD:
+            if placeholder is not None:
+                placeholder.markdown(cached_answers[best_match][2])
+            return cached_answers[best_match][2]
     
-    chain = prompt_template | llm | StrOutputParser()
-    return chain.invoke({"question": question, "document_text": document_text})
+    relevant_docs = vectorstore.similarity_search_by_vector(question_embedding.tolist(), k=RETRIEVAL_K)
+    document_text = "\n\n".join(doc.page_content for doc in relevant_docs)
+    response = await stream_to_placeholder(get_chat_chain(), {"question": question, "document_text": document_text}, placeholder)
+    cached_answers.append((question_embedding, question, response))
+    return response
 
-def generate_citations(document_text):
-    """Generate citations in various styles"""
-    llm = initialize_llm()
+@st.cache_resource(show_spinner=False)
+def get_arxiv_request_gate():
+    """Track when arXiv was last queried, so requests stay spaced out across sessions"""
+    return threading.Lock(), [float("-inf")]
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def fetch_arxiv_results(query, max_results):
+    """Fetch arXiv papers matching the search query, cached per query for an hour"""
+    import feedparser
+    import httpx
+    lock, last_request = get_arxiv_request_gate()
+    with lock:
+        time.sleep(max(0, last_request[0] + ARXIV_MIN_INTERVAL_SECONDS - time.monotonic()))
+        last_request[0] = time.monotonic()
     
-    prompt_template = ChatPromptTemplate.from_messages([
-    ("system", """You are an expert academic research assistant. Generate citations in multiple styles strictly following these rules:
-
-1. Output ONLY the citation formats below, nothing else
-2. No introductory sentences or explanations
-3. Use this exact format for each style:
-
-**APA Style**
-<br>
-[APA citation]
-
-**MLA Style**
-<br>
-[MLA citation]
-
-**Harvard Style**
-<br>
-[Harvard citation]
-
-**IEEE Style**
-<br>
-[IEEE citation]
-
-**Chicago Style**
-<br>
-[Chicago citation]
-
-**Vancouver Style**
-<br>
-[Vancouver citation]
-
-**AMA Style**
-<br>
-[AMA citation]
-
-4. Include all available elements: authors, title, journal, year, volume, issue, pages, DOI
-5. For missing information, use [assumed information] and keep it minimal
-6. Do not add any other text outside the citation formats"""),
-    ("user", "{document_text}")
-])
+    try:
+        response = httpx.get(
+            ARXIV_API_URL,
+            params={
+                "search_query": query,
+                "start": 0,
+                "max_results": max_results,
+                "sortBy": "relevance",
+                "sortOrder": "descending"
+            },
+            timeout=ARXIV_TIMEOUT_SECONDS
+        )
+        response.raise_for_status()
+    except httpx.TimeoutException as e:
+        raise TimeoutError("arXiv tidak merespons") from e
     
-    chain = prompt_template | llm | StrOutputParser()
-    return chain.invoke({"document_text": document_text})
+    results = []
+    for entry in feedparser.parse(response.text).entries:
+        if "/api/errors" in entry.id:
+            raise ValueError(entry.summary)
+        results.append({
+            "title": " ".join(entry.title.split()),
+            "authors": [author.name for author in entry.get("authors", [])],
+            "published": time.strftime("%Y-%m-%d", entry.published_parsed),
+            "summary": entry.summary,
+            "pdf_url": next((link.href for link in entry.links if link.get("title") == "pdf"), entry.link),
+            "abs_url": f"https://arxiv.org/abs/{entry.id.split('/abs/')[-1]}",
+            "doi": entry.get("arxiv_doi") or "Tidak tersedia",
+        })
+    return results
 
-def find_related_journals(document_text):
-    """Find related journals using arXiv API"""
-    llm = initialize_llm()
-    
-    keyword_prompt = ChatPromptTemplate.from_messages([
-    ("system", """Anda adalah asisten penelitian yang ahli dalam menganalisis judul jurnal akademik. Ekstrak 3-5 frasa kunci terpenting dari judul jurnal yang akan digunakan untuk mencari paper sejenis. 
+QUERY_SYSTEM_PROMPT = """Anda adalah asisten penelitian yang ahli dalam menganalisis jurnal akademik. Dari judul dan abstrak jurnal, ekstrak 3-5 frasa kunci terpenting lalu susun query pencarian arXiv untuk menemukan paper sejenis.
 
 Aturan:
 1. Ambil konsep inti, metode, teknologi, dan objek penelitian
 2. Prioritaskan istilah teknis/spesifik
-3. Gabungkan kata yang harus berdampingan (contoh: "regresi linear")
+3. Gabungkan kata yang harus berdampingan (contoh: "linear regression")
 4. Abaikan kata umum seperti "analisis", "studi", "penggunaan" kecuali sangat relevan
-5. Hasil HANYA berisi kata kunci dipisahkan koma, tanpa penjelasan
-6. Terjemahkan hasil ke dalam bahasa Inggris
+5. Terjemahkan semua frasa kunci ke dalam bahasa Inggris
+6. Query memakai sintaks arXiv: setiap frasa ditulis sebagai all:"frasa", gabungkan 2-3 konsep terpenting dengan AND dan sinonim dengan OR
+7. Hasil HANYA berupa JSON dengan format {{"concepts": [...], "query": "..."}}, tanpa penjelasan
 
 Contoh:
 Judul: "Analisis Prediksi Harga Rumah Sesuai Spesifikasi Menggunakan Metode Regresi Linear Berganda Berbasis Shiny R"
-Output: Prediksi harga rumah, regresi linear berganda, Shiny R
+Output: {{"concepts": ["house price prediction", "multiple linear regression", "Shiny R"], "query": "all:\\"house price prediction\\" AND all:\\"multiple linear regression\\""}}
 
 Judul: "Penerapan Metode Waterfall dalam Perencanaan Sistem Informasi Penjualan Buku berbasis Aplikasi Website (Studi Kasus: Penjual Buku Toko 21 Jombang)"
-Output: Waterfall, Perencanaan, Sistem Informasi, Aplikasi, Website
+Output: {{"concepts": ["Waterfall", "information system", "book sales", "web application"], "query": "all:\\"Waterfall\\" AND all:\\"information system\\" AND (all:\\"book sales\\" OR all:\\"web application\\")"}}"""
 
-Judul: "{document_text}"
-Output: """),
-    ("user", "{document_text}")
-])
-    
-    keyword_chain = keyword_prompt | llm | StrOutputParser()
-    keywords = keyword_chain.invoke({"document_text": document_text})
-    
-    client = arxiv.Client()
-    search = arxiv.Search(
-        query=keywords,
-        max_results=5,
-        sort_by=arxiv.SortCriterion.Relevance
-    )
+@st.cache_resource(show_spinner=False)
+def get_query_prompt():
+    """Build the arXiv query prompt once per process"""
+    return ChatPromptTemplate.from_messages([
+        ("system", QUERY_SYSTEM_PROMPT),
+        ("user", "{title_and_abstract}")
+    ])
+
+def get_query_chain():
+    """Compose the arXiv query chain on the LLM of the running event loop"""
+    return get_query_prompt() | current_llm.get() | JsonOutputParser()
+
+async def search_arxiv(query):
+    """Run an arXiv search off the event loop; the HTTP request carries its own timeout"""
+    return await asyncio.to_thread(fetch_arxiv_results, query, 7)
+
+async def score_papers(reference_text, papers):
+    """Rank papers by embedding similarity to the reference text, best first"""
+    if not papers:
+        return []
+    texts = [reference_text] + [f"{paper['title']} {paper['summary']}" for paper in papers]
+    vectors = np.array(await asyncio.to_thread(load_embeddings().embed_documents, texts))
+    scores = vectors[1:] @ vectors[0]
+    for paper, score in zip(papers, scores):
+        paper["relevance_score"] = float(score)
+    return sorted(papers, key=lambda paper: paper["relevance_score"], reverse=True)
+
+async def find_related_journals(title_and_abstract):
+    """Find related journals using arXiv API"""
+    await throttle_request()
+    search_terms = await get_query_chain().ainvoke({"title_and_abstract": title_and_abstract})
+    concepts = search_terms.get("concepts", [])
+    query = search_terms.get("query") or " OR ".join(f'all:"{concept}"' for concept in concepts)
     
-    results = []
     try:
-        for result in client.results(search):
-            arxiv_keywords = [tag.term for tag in result.tags] if hasattr(result, 'tags') else []
-            combined_keywords = arxiv_keywords
-            
-            results.append({
-            "title": result.title,
-            "authors": [author.name for author in result.authors],
-            "published": result.published.strftime("%Y-%m-%d"),
-            "summary": result.summary,
-            "pdf_url": result.pdf_url,
-            "doi": result.doi if result.doi else "Tidak tersedia",
-        })
+        results = await score_papers(", ".join(concepts) or query, await search_arxiv(query))
+    except TimeoutError:
+        st.warning("Pencarian di arXiv terlalu lama. Coba cari lagi beberapa saat lagi.")
+        return []
     except Exception as e:
         st.error(f"Error saat mencari di arXiv: {str(e)}")
         return []
+    results = results[:RELATED_PAPER_COUNT]
     
     formatted_results = []
     for idx, paper in enumerate(results, 1):
@@ -220,12 +607,37 @@ Output: """),
 **Ringkasan**:  
 {paper['summary'][:300]}...  
 
-[📄 Unduh PDF]({paper['pdf_url']}) | [🔗 Lihat Detail](https://arxiv.org/abs/{paper['pdf_url'].split('/')[-1].replace('.pdf','')})
+[📄 Unduh PDF]({paper['pdf_url']}) | [🔗 Lihat Detail]({paper['abs_url']})
 """
         formatted_results.append(formatted)
     
     return formatted_results
 
+async def analyze_document(splits, summary_placeholder=None):
+    """Generate the report and related journals concurrently"""
+    return await asyncio.gather(
+        summarize_document(splits, summary_placeholder),
+        find_related_journals(get_title_and_abstract(splits)),
+        return_exceptions=True
+    )
+
+def get_upload_hash(uploaded_file):
+    """Hash the uploaded PDF once per upload rather than on every rerun"""
+    if st.session_state.get("upload_file_id") != uploaded_file.file_id:
+        st.session_state.upload_hash = hashlib.sha256(uploaded_file.getvalue()).hexdigest()
+        st.session_state.upload_file_id = uploaded_file.file_id
+    return st.session_state.upload_hash
+
+def reset_document_state():
+    """Forget the results of the current PDF so a failed upload leaves nothing half-updated"""
+    st.session_state.splits = []
+    st.session_state.summary = None
+    st.session_state.citations = None
+    st.session_state.related_papers = None
+    st.session_state.document_hash = None
+    st.session_state.pop("vectorstore", None)
+    st.session_state.current_mode = "summary"
+
 def main():
     st.set_page_config(page_title="AI-Powered Research Assistant", page_icon="📚", layout="wide")
     
@@ -237,12 +649,14 @@ def main():
         st.session_state.chat_history = []
     if 'current_chat' not in st.session_state:
         st.session_state.current_chat = None
-    if 'full_text' not in st.session_state:
-        st.session_state.full_text = ""
+    if 'splits' not in st.session_state:
+        st.session_state.splits = []
     if 'citations' not in st.session_state:
         st.session_state.citations = None
     if 'related_papers' not in st.session_state:
         st.session_state.related_papers = None
+    if 'semantic_cache' not in st.session_state:
+        st.session_state.semantic_cache = {}
     
     col1, col2 = st.columns([1, 2], gap="large")
     
@@ -278,7 +692,6 @@ def main():
                 st.session_state.current_mode = "citation"
             if st.button("🔍 Jelajahi Jurnal Terkait", use_container_width=True):
                 st.session_state.current_mode = "related_journals"
-                st.session_state.related_papers = None
         
         st.markdown("")
         uploaded_file = st.file_uploader("Pilih file PDF", type=["pdf"], key="uploader")
@@ -287,18 +700,42 @@ def main():
         st.caption("© 2025 Rafli Damara")
         
     with col2:
-        if uploaded_file is not None and (st.session_state.summary is None or 'uploaded_file' not in st.session_state or st.session_state.uploaded_file != uploaded_file.name):
+        document_hash = get_upload_hash(uploaded_file) if uploaded_file is not None else None
+        if uploaded_file is not None and (st.session_state.summary is None or st.session_state.get("document_hash") != document_hash):
             st.subheader("📄 Hasil Ringkasan")
             st.markdown("")
+            summary_placeholder = st.empty()
             with st.spinner("Sabar yaaa, jurnalnya lagi aku baca... 🤓"):
                 try:
-                    st.session_state.uploaded_file = uploaded_file.name
-                    splits = load_and_split_pdf(uploaded_file)
-                    st.session_state.full_text = "\n\n".join([doc.page_content for doc in splits])
-                    st.session_state.summary = generate_summary(st.session_state.full_text)
+                    results = load_cached_results(document_hash)
+                    is_cached = results is not None
+                    if not is_cached:
+                        splits = load_and_split_pdf(document_hash, uploaded_file)
+                        if not splits:
+                            raise ValueError("Tidak ada teks yang bisa dibaca dari PDF ini.")
+                        report, related_papers = run_async(analyze_document(splits, summary_placeholder))
+                        if isinstance(report, Exception):
+                            raise report
+                        if not report.get("summary"):
+                            raise ValueError("Ringkasan jurnal tidak berhasil dibuat.")
+                        results = {
+                            "splits": splits,
+                            "summary": render_summary(report["summary"]),
+                            "citations": render_citations(report.get("citations") or {}) or None,
+                            "related_papers": None if isinstance(related_papers, Exception) else related_papers
+                        }
+                    vectorstore = build_vectorstore(document_hash, results["splits"])
+                    
+                    for field, value in results.items():
+                        st.session_state[field] = value
+                    st.session_state.document_hash = document_hash
+                    st.session_state.vectorstore = vectorstore
+                    if not is_cached:
+                        save_cached_results(document_hash)
                     st.session_state.current_mode = "summary"
                     st.rerun()
                 except Exception as e:
+                    reset_document_state()
                     st.error(f"Terjadi kesalahan: {str(e)}")
                     st.error("Pastikan file PDF berisi teks yang dapat dibaca (bukan scan gambar).")
         
@@ -324,6 +761,10 @@ def main():
                     "content": "Kamu mau tau apa tentang aku?"
                 })
             
+            if st.session_state.get("vectorstore") is None:
+                st.info("Silakan unggah file PDF di kolom sebelah kiri untuk memulai")
+                return
+            
             chat_container = st.container()
             
             with chat_container:
@@ -341,35 +782,43 @@ def main():
                 with chat_container:
                     with st.chat_message("assistant"):
                         message_placeholder = st.empty()
-                        with st.spinner("Bentar mikir dulu yaa..."):
-                            time.sleep(1)
-                            response = chat_with_pdf(prompt, st.session_state.full_text)
-                            message_placeholder.markdown(response)
+                        response = run_async(chat_with_pdf(prompt, st.session_state.vectorstore, st.session_state.document_hash, message_placeholder))
                 
                 st.session_state.chat_history.append({"role": "assistant", "content": response})
-                st.rerun()
         
         elif st.session_state.current_mode == "citation":
             st.subheader("📝 Sitasi Jurnal")
             st.markdown("")
             
+            if st.session_state.get("document_hash") is None:
+                st.info("Silakan unggah file PDF di kolom sebelah kiri untuk memulai")
+                return
+            
             if st.session_state.citations is None:
+                citations_placeholder = st.empty()
                 with st.spinner("Sabar yaaa, sitasi jurnal ini lagi aku susun... 😁"):
-                    st.session_state.citations = generate_citations(st.session_state.full_text)
-                    st.rerun()
+                    try:
+                        citations = run_async(cite_document(st.session_state.splits, citations_placeholder))
+                        st.session_state.citations = render_citations(citations) or None
+                        if st.session_state.citations is not None:
+                            save_cached_results(st.session_state.document_hash)
+                    except Exception as e:
+                        st.error(f"Gagal membuat sitasi: {str(e)}")
             else:
                 st.markdown(st.session_state.citations)
         
         elif st.session_state.current_mode == "related_journals":       
             st.subheader("🔍 Jurnal Terkait")
             
+            if st.session_state.get("document_hash") is None:
+                st.info("Silakan unggah file PDF di kolom sebelah kiri untuk memulai")
+                return
+            
             if st.session_state.related_papers is None:
                 with st.spinner("Sabar yaaa, dicari dulu... 🧐"):
                     try:
-                        st.session_state.related_papers = find_related_journals(st.session_state.full_text)
-                        if not st.session_state.related_papers:
-                            st.warning("Tidak ditemukan jurnal terkait. Coba dengan kata kunci yang lebih spesifik.")
-                        st.rerun()
+                        st.session_state.related_papers = run_async(find_related_journals(get_title_and_abstract(st.session_state.splits)))
+                        save_cached_results(st.session_state.document_hash)
                     except Exception as e:
                         st.error(f"Gagal mencari jurnal terkait: {str(e)}")
                         st.session_state.related_papers = []
@@ -380,12 +829,12 @@ def main():
                 for paper in st.session_state.related_papers:
                     st.markdown(paper, unsafe_allow_html=True)
                     st.markdown("---")
-                
-                if st.button("Coba Cari Lagi", type="primary"):
-                    st.session_state.related_papers = None
-                    st.rerun()
             else:
                 st.info("Tidak ada hasil yang ditemukan. Coba unggah jurnal dengan konten yang lebih spesifik.")
+            
+            if st.button("Coba Cari Lagi", type="primary"):
+                st.session_state.related_papers = None
+                st.rerun()
 
 if __name__ == "__main__":
     main()